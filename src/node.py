@@ -1,81 +1,195 @@
 """Low-level api to work with relationships"""
+import array
+import collections
 import functools
 import itertools
+import operator
+import sys
+
+def _intern(name):
+    "Interns node names so dict and set lookups compare by identity"
+    return sys.intern(name) if type(name) is str else name
+
+
+_OPS = {
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "ne": operator.ne,
+}
 
 class BaseFilter:
     "Base filter that accepts one argument"
+    __slots__ = ("key", "value", "_attr", "_cmp")
+    # Specialized filters compare inline in match() and don't need _cmp
+    _specialized = False
+
+    def __new__(cls, *args, **query):
+        # BaseFilter builds a subclass specialized for the key's operator
+        if cls is BaseFilter:
+            assert len(query) == 1
+            cls = _FILTERS.get(cls.parse_operator(next(iter(query))), _EqFilter)
+        return object.__new__(cls)
+
     def __init__(self, **query):
         assert len(query) == 1
         for key, value in query.items():
             self.key = key
             self.value = value
 
+        # Resolve the attribute and the operator once, not on every match
+        self._attr = self.parse_key(self.key)
+        if not self._specialized:
+            self._cmp = _OPS.get(self.parse_operator(self.key), operator.eq)
+
     @staticmethod
     def parse_key(key):
         "Parses the key to remove the __ if there is one"
         return key.split("__")[0]
 
+    @staticmethod
+    def parse_operator(key):
+        "Parses the operator after the __, if there is one"
+        parts = key.split("__")
+        return parts[-1] if len(parts) > 1 else None
+
     def match(self, value):
         "Checks wether value matches this filter"
-        parsed_key = self.parse_key(self.key)
-        if parsed_key != "_self":
-            value = getattr(value, parsed_key, None)
-
-        if value is None:
-            return False
-
-        if self.key.endswith("__gt"):
-            return value > self.value
-        elif self.key.endswith("__gte"):
-            return value >= self.value
-        elif self.key.endswith("__lt"):
-            return value < self.value
-        elif self.key.endswith("__lte"):
-            return value <= self.value
-        elif self.key.endswith("__ne"):
-            return value != self.value
-        else:
-            return value == self.value
+        if self._attr != "_self":
+            value = getattr(value, self._attr, None)
+        return value is not None and self._cmp(value, self.value)
+
+
+class _EqFilter(BaseFilter):
+    "Filter matching attribute == value"
+    __slots__ = ()
+    _specialized = True
+
+    def match(self, value):
+        if self._attr != "_self":
+            value = getattr(value, self._attr, None)
+        return value is not None and value == self.value
+
+
+class _NeFilter(BaseFilter):
+    "Filter matching attribute != value"
+    __slots__ = ()
+    _specialized = True
+
+    def match(self, value):
+        if self._attr != "_self":
+            value = getattr(value, self._attr, None)
+        return value is not None and value != self.value
+
+
+class _GtFilter(BaseFilter):
+    "Filter matching attribute > value"
+    __slots__ = ()
+    _specialized = True
+
+    def match(self, value):
+        if self._attr != "_self":
+            value = getattr(value, self._attr, None)
+        return value is not None and value > self.value
+
+
+class _GteFilter(BaseFilter):
+    "Filter matching attribute >= value"
+    __slots__ = ()
+    _specialized = True
+
+    def match(self, value):
+        if self._attr != "_self":
+            value = getattr(value, self._attr, None)
+        return value is not None and value >= self.value
+
+
+class _LtFilter(BaseFilter):
+    "Filter matching attribute < value"
+    __slots__ = ()
+    _specialized = True
+
+    def match(self, value):
+        if self._attr != "_self":
+            value = getattr(value, self._attr, None)
+        return value is not None and value < self.value
+
+
+class _LteFilter(BaseFilter):
+    "Filter matching attribute <= value"
+    __slots__ = ()
+    _specialized = True
+
+    def match(self, value):
+        if self._attr != "_self":
+            value = getattr(value, self._attr, None)
+        return value is not None and value <= self.value
+
+
+_FILTERS = {
+    "gt": _GtFilter,
+    "gte": _GteFilter,
+    "lt": _LtFilter,
+    "lte": _LteFilter,
+    "ne": _NeFilter,
+}
+
+
+def _filter_cost(_filter):
+    "Rough cost of a filter, so cheap and selective ones run first"
+    if isinstance(_filter, AndFilter):
+        return 2
+    # Generic filters compare through _cmp, specialized ones by their class
+    if (isinstance(_filter, _EqFilter)
+            or getattr(_filter, "_cmp", None) is operator.eq):
+        return 0
+    return 1
 
 
 class AndFilter(BaseFilter):
     "Composite filter that combines two filters"
+    __slots__ = ("filters",)
 
     def __init__(self, filters, **query):
-        self.filters = filters
-        for key, value in query.items():
-            self.filters.append(BaseFilter(**{key:value}))
+        filters = filters + [BaseFilter(**{key:value}) for key, value in query.items()]
+        self.filters = sorted(filters, key=_filter_cost)
 
     def match(self, value):
-        is_match = True
-        for _filter in self.filters:
-            is_match &= _filter.match(value)
-        return is_match
+        return all(_filter.match(value) for _filter in self.filters)
 
 
 class OrFilter(AndFilter):
     "Composite filter that combines two filters via an or"
+    __slots__ = ()
 
     def match(self, value):
-        is_match = False
-        for _filter in self.filters:
-            is_match |= _filter.match(value)
-        return is_match
+        return any(_filter.match(value) for _filter in self.filters)
 
 
 
 class Vertex:
     "Represents a dependency link"
+    __slots__ = ("vertex_type", "from_node", "to_node", "_hash")
+
+    def __new__(cls, *args, **attributes):
+        # Extra attributes need a __dict__, which plain vertices go without
+        if attributes and cls is Vertex:
+            cls = _AttributedVertex
+        return object.__new__(cls)
 
     def __init__(self, vertex_type:str, from_node:str, to_node:str, **attributes):
         # Ensures that we won't override our parameters...
         assert "from_node" not in attributes
         assert "to_node" not in attributes
         assert "vertex_type" not in attributes
+        assert "_hash" not in attributes
 
-        self.vertex_type = vertex_type
-        self.from_node = from_node
-        self.to_node = to_node
+        self.vertex_type = _intern(vertex_type)
+        self.from_node = _intern(from_node)
+        self.to_node = _intern(to_node)
+        # Identity fields never change, so hash them only once
+        self._hash = hash((self.vertex_type, self.from_node, self.to_node))
 
         for key, value in attributes.items():
             setattr(self, key, value)
@@ -87,79 +201,196 @@ class Vertex:
                     and self.to_node == other.to_node)
 
     def __hash__(self):
-        return hash((self.vertex_type, self.from_node, self.to_node))
+        return self._hash
 
     def __str__(self):
         return "(%s) --> (%s)" % (self.from_node, self.to_node)
 
+    def __setstate__(self, state):
+        # The cached hash is only valid in the process that computed it
+        attributes, slots = state if isinstance(state, tuple) else (state, None)
+        if attributes:
+            self.__dict__.update(attributes)
+        for key, value in (slots or {}).items():
+            setattr(self, key, value)
+        self._hash = hash((self.vertex_type, self.from_node, self.to_node))
+
+class _AttributedVertex(Vertex):
+    "Vertex carrying extra attributes"
+
+
 class CircularDependencyError(BaseException):
     pass
 
+_DONE = object()
+
 class DependencyGraph:
 
     def __init__(self, nodes, plugins):
-        self.nodes = set(nodes)
+        self.nodes = set(map(_intern, nodes))
         self.plugins = plugins
 
-        def generate_vertices():
-            nodes = list(self.nodes)
-            while nodes:
-                yield from self.build_vertices(nodes.pop())
-        self.vertices = set(generate_vertices())
+        # Nodes are interned to integer ids, edges are kept as parallel arrays
+        self._id = {}
+        self._name = []
+        self._from_ids = array.array("i")
+        self._to_ids = array.array("i")
+        self.vertices = self._build_vertices()
+        self._row_ptr, self._col_idx = self._build_index()
+        # Transitive dependencies, filled in as they are queried
+        self._closures = {}
 
-        if not self.is_acyclic():
-            raise CircularDependencyError()
+        # The graph is never modified once built
+        self.nodes = frozenset(self.nodes)
 
     def __str__(self):
         return "\n".join([str(vertex) for vertex in self.vertices])
 
+    def _node_id(self, node):
+        "Returns the integer id of a node, assigning one if needed"
+        node_id = self._id.get(node)
+        if node_id is None:
+            node_id = self._id[node] = len(self._name)
+            self._name.append(node)
+        return node_id
+
     def is_acyclic(self):
-        "Checks for circular dependencies"
-        nodes = []
-
-        # We build an index
-        connected_to = {node: set() for node in self.nodes}
-        from_nodes = {node: set() for node in self.nodes}
-        for vertice in self.vertices:
-            connected_to[vertice.to_node].add(vertice)
-            from_nodes[vertice.from_node].add(vertice)
-
-        for node in self.nodes:
-            # Only nodes that don't have someone dependent on
-            if len(connected_to[node]) == 0:
-                nodes.append(node)
-
-        vertices = list(self.vertices)
-        deleted_vertices = set()
-
-        while nodes:
-            node = nodes.pop()
-
-            connected = from_nodes[node] - deleted_vertices
-            for vertice in connected:
-                deleted_vertices.add(vertice)
-                if not connected_to[node] - deleted_vertices:
-                    nodes.append(vertice.to_node)
-        return len(vertices) == len(deleted_vertices)
-
-    def build_vertices(self, node):
-        plugins = filter(lambda p: p.can_create_vertex(node), self.plugins)
-        for plugin in plugins:
+        "Checks for circular dependencies (Kahn's algorithm)"
+        col_idx = self._col_idx
+        in_degree = array.array("i", [0]) * len(self._name)
+        for to_id in col_idx:
+            in_degree[to_id] += 1
+
+        # Only nodes that don't have someone dependent on
+        queue = collections.deque(
+            i for i, degree in enumerate(in_degree) if degree == 0)
+        processed = 0
+
+        while queue:
+            node_id = queue.popleft()
+            processed += 1
+            for to_id in self._successors(node_id):
+                in_degree[to_id] -= 1
+                if in_degree[to_id] == 0:
+                    queue.append(to_id)
+        return processed == len(self._name)
+
+    def _build_vertices(self):
+        "Discovers every vertex reachable from the graph nodes, rejecting cycles"
+        roots = list(self.nodes)
+        for node in roots:
+            self._node_id(node)
+
+        # Vertices keyed by (vertex_type, from_node, to_node)
+        vertices = {}
+        # 1 while a node is on the current path, 2 once it is finished
+        color = {}
+        for root in roots:
+            if root in color:
+                continue
+            color[root] = 1
+            path = [root]
+            stack = [iter(self._expand(root, vertices))]
+            while stack:
+                sub_node = next(stack[-1], _DONE)
+                if sub_node is _DONE:
+                    stack.pop()
+                    color[path.pop()] = 2
+                    continue
+
+                state = color.get(sub_node)
+                if state == 1:
+                    cycle = path[path.index(sub_node):] + [sub_node]
+                    raise CircularDependencyError(" --> ".join(map(str, cycle)))
+                if state is None:
+                    color[sub_node] = 1
+                    path.append(sub_node)
+                    stack.append(iter(self._expand(sub_node, vertices)))
+        return frozenset(vertices.values())
+
+    def _expand(self, node, vertices):
+        "Collects the vertices of a node from the plugins, returns its dependencies"
+        dependencies = []
+        for plugin in self.plugins:
+            if not plugin.can_create_vertex(node):
+                continue
             for vertex in plugin.vertices(node):
-                if vertex.to_node not in self.nodes:
-                    self.nodes.add(vertex.to_node)
-                    # I know, we are limited by recursions.
-                    # Fix it when it is a problem
-                    yield from self.build_vertices(vertex.to_node)
-                yield vertex
+                # Plugins may yield bare (type, from, to) tuples, so
+                # duplicates are dropped before any Vertex is built
+                if isinstance(vertex, Vertex):
+                    key = (vertex.vertex_type, vertex.from_node, vertex.to_node)
+                    if key in vertices:
+                        continue
+                else:
+                    key = vertex
+                    if key in vertices:
+                        continue
+                    vertex = Vertex(*key)
+
+                self.nodes.add(vertex.to_node)
+                vertices[key] = vertex
+                self._from_ids.append(self._node_id(vertex.from_node))
+                self._to_ids.append(self._node_id(vertex.to_node))
+                dependencies.append(vertex.to_node)
+        return dependencies
+
+    def _build_index(self):
+        "Builds the CSR index of outgoing edges (counting sort on from ids)"
+        row_ptr = array.array("i", [0]) * (len(self._name) + 1)
+        for from_id in self._from_ids:
+            row_ptr[from_id + 1] += 1
+        for i in range(len(self._name)):
+            row_ptr[i + 1] += row_ptr[i]
+
+        col_idx = array.array("i", [0]) * len(self._to_ids)
+        fill = row_ptr[:-1]
+        for from_id, to_id in zip(self._from_ids, self._to_ids):
+            col_idx[fill[from_id]] = to_id
+            fill[from_id] += 1
+        return row_ptr, col_idx
+
+    def _successors(self, node_id):
+        "Returns the ids of the direct dependencies of a node id"
+        return self._col_idx[self._row_ptr[node_id]:self._row_ptr[node_id + 1]]
+
+    def _transitive(self, node_id):
+        "Returns the ids of every dependency of a node id"
+        closures = self._closures
+        if node_id in closures:
+            return closures[node_id]
+
+        # Post-order walk, so a node's closure is the union of its children's
+        stack = [node_id]
+        while stack:
+            current = stack[-1]
+            if current in closures:
+                stack.pop()
+                continue
+            pending = [sub_id for sub_id in self._successors(current)
+                       if sub_id not in closures]
+            if pending:
+                stack.extend(pending)
+                continue
+
+            stack.pop()
+            closure = set()
+            for sub_id in self._successors(current):
+                # Anything already in the closure brought its own closure along
+                if sub_id not in closure:
+                    closure.add(sub_id)
+                    closure |= closures[sub_id]
+            closures[current] = frozenset(closure)
+        return closures[node_id]
 
     def dependencies(self, node, follow=False):
         "Returns dependencies of a node, either all or direct"
-        vertices = filter(lambda v: v.from_node == node, self.vertices)
-        for vertex in vertices:
-            yield vertex.to_node
-            if follow:
-                yield from self.dependencies(vertex.to_node, follow)
+        node_id = self._id.get(node)
+        if node_id is None:
+            return
+
+        ids = self._transitive(node_id) if follow else self._successors(node_id)
+        for sub_id in ids:
+            yield self._name[sub_id]
 
 
 class Plugin:
@@ -167,27 +398,32 @@ class Plugin:
     file_extensions = "*"
 
     def __init__(self, **kwargs):
-        for key, value in kwargs:
+        for key, value in kwargs.items():
             setattr(self, key, value)
 
     def vertices(self, node):
-        "Yields vertices for a node"
+        """Yields vertices for a node, either as Vertex objects or as
+        (vertex_type, from_node, to_node) tuples"""
 
         raise NotImplementedError()
 
+    def _resolve_extensions(self):
+        "Returns file extensions as a tuple, or None when all are accepted"
+        if self.file_extensions == "*":
+            return None
+        if isinstance(self.file_extensions, str):
+            return (self.file_extensions,)
+        return tuple(self.file_extensions)
+
     def can_create_vertex(self, node):
         "Checks if this plugin can create links for this type of node"
 
-        if self.file_extensions == "*":
-            return True
-        if isinstance(self.file_extensions, str):
-            return node.name.endswith(self.file_extensions)
-        else:
-            # If the file extension of the node name is in the plugins file ext
-            ends_with = False
-            for file_ext in self.file_extensions:
-                ends_with = ends_with or node.name.endswith(file_ext)
-            return ends_with
+        # Resolved on first use, so subclasses need not call __init__
+        try:
+            extensions = self._extensions
+        except AttributeError:
+            extensions = self._extensions = self._resolve_extensions()
+        return extensions is None or node.name.endswith(extensions)
 
 class StaticDependencies(Plugin):
     "Plugin to illustrate manual dependencies"
@@ -195,10 +431,15 @@ class StaticDependencies(Plugin):
     # ("A", ("B", "C", "D"))
 
     def __init__(self, dependencies, **kwargs):
+        super().__init__(**kwargs)
         self.dependencies = dependencies
 
+        # Index the dependencies by their source node
+        by_src = {}
+        for src, deps in dependencies:
+            by_src.setdefault(_intern(src), []).extend(map(_intern, deps))
+        self._by_src = {src: tuple(deps) for src, deps in by_src.items()}
+
     def vertices(self, node):
-        for deps in self.dependencies:
-            if deps[0] == node:
-                for sub_node in deps[1]:
-                    yield Vertex("static", node, sub_node)
+        for sub_node in self._by_src.get(node, ()):
+            yield ("static", node, sub_node)
@@ -0,0 +1,114 @@
+import unittest
+from node import BaseFilter, AndFilter, OrFilter
+
+class Item:
+    def __init__(self, **attributes):
+        for key, value in attributes.items():
+            setattr(self, key, value)
+
+
+class CountingFilter:
+    "Wraps a filter and records how many times it was evaluated"
+
+    def __init__(self, **query):
+        self.filter = BaseFilter(**query)
+        self.calls = 0
+
+    def match(self, value):
+        self.calls += 1
+        return self.filter.match(value)
+
+
+class CustomFilter(BaseFilter):
+    "User filter relying on the inherited match"
+
+
+class BaseFilterTest(unittest.TestCase):
+    def test_operators(self):
+        "Test every comparison operator"
+        item = Item(size=3)
+        cases = [
+            ("size", 3, True), ("size", 4, False),
+            ("size__ne", 4, True), ("size__ne", 3, False),
+            ("size__gt", 2, True), ("size__gt", 3, False),
+            ("size__gte", 3, True), ("size__gte", 4, False),
+            ("size__lt", 4, True), ("size__lt", 3, False),
+            ("size__lte", 3, True), ("size__lte", 2, False),
+        ]
+        for key, value, expected in cases:
+            for filter_class in (BaseFilter, CustomFilter):
+                with self.subTest(key=key, value=value, cls=filter_class):
+                    _filter = filter_class(**{key: value})
+                    self.assertEqual(_filter.match(item), expected)
+
+    def test_self(self):
+        "Test filters comparing the value itself"
+        self.assertTrue(BaseFilter(_self__gt=2).match(3))
+        self.assertFalse(BaseFilter(_self__ne=3).match(3))
+        self.assertTrue(BaseFilter(_self="a").match("a"))
+
+    def test_missing_attribute(self):
+        "Test that a missing attribute never matches"
+        self.assertFalse(BaseFilter(size__ne=3).match(Item()))
+        self.assertFalse(BaseFilter(_self=None).match(None))
+
+    def test_unknown_operator(self):
+        "Test that an unknown operator falls back to equality"
+        self.assertTrue(BaseFilter(size__foo=3).match(Item(size=3)))
+        self.assertFalse(BaseFilter(size__foo=3).match(Item(size=4)))
+        self.assertTrue(CustomFilter(size__foo=3).match(Item(size=3)))
+
+    def test_custom_filter(self):
+        "Test that subclasses of BaseFilter are not specialized"
+        self.assertIs(type(CustomFilter(size__gt=1)), CustomFilter)
+
+
+class CompositeFilterTest(unittest.TestCase):
+    def test_and_filter(self):
+        "Test that every sub filter must match"
+        _filter = AndFilter([BaseFilter(size__gt=2)], name="a")
+        self.assertTrue(_filter.match(Item(name="a", size=3)))
+        self.assertFalse(_filter.match(Item(name="a", size=1)))
+        self.assertFalse(_filter.match(Item(name="b", size=3)))
+
+    def test_or_filter(self):
+        "Test that one sub filter matching is enough"
+        _filter = OrFilter([BaseFilter(size__lt=2)], name="a")
+        self.assertTrue(_filter.match(Item(name="a", size=3)))
+        self.assertTrue(_filter.match(Item(name="b", size=1)))
+        self.assertFalse(_filter.match(Item(name="b", size=3)))
+
+    def test_mixed_filters(self):
+        "Test nested and / or filters"
+        _filter = AndFilter([OrFilter([BaseFilter(name="a")], name="b")],
+                            size__gte=2)
+        self.assertTrue(_filter.match(Item(name="a", size=2)))
+        self.assertTrue(_filter.match(Item(name="b", size=5)))
+        self.assertFalse(_filter.match(Item(name="c", size=5)))
+        self.assertFalse(_filter.match(Item(name="b", size=1)))
+
+    def test_short_circuit(self):
+        "Test that evaluation stops at the first decisive filter"
+        first, second = CountingFilter(name="a"), CountingFilter(name="b")
+        self.assertFalse(AndFilter([first, second]).match(Item(name="c")))
+        self.assertEqual(first.calls + second.calls, 1)
+
+        first, second = CountingFilter(name="a"), CountingFilter(name="b")
+        self.assertTrue(OrFilter([first, second]).match(Item(name="a")))
+        self.assertEqual(first.calls + second.calls, 1)
+
+    def test_equality_first(self):
+        "Test that equality filters, custom ones included, run first"
+        custom = CustomFilter(name="a")
+        _filter = AndFilter([BaseFilter(size__gt=2), AndFilter([]), custom])
+        self.assertIs(_filter.filters[0], custom)
+
+        plain = BaseFilter(name="a")
+        _filter = AndFilter([CustomFilter(size__gt=2), plain])
+        self.assertIs(_filter.filters[0], plain)
+
+    def test_filters_not_modified(self):
+        "Test that the list given to a composite filter is left untouched"
+        filters = [BaseFilter(size__gt=2)]
+        AndFilter(filters, name="a")
+        self.assertEqual(len(filters), 1)
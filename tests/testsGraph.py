@@ -1,7 +1,30 @@
 
+import copy
+import gc
+import pickle
 import unittest
 import time
-from node import DependencyGraph, StaticDependencies, CircularDependencyError
+import weakref
+from node import (DependencyGraph, StaticDependencies, CircularDependencyError,
+                  Vertex, Plugin)
+
+
+class CustomVertex(Vertex):
+    "User subclass of Vertex"
+
+
+class VertexDependencies(Plugin):
+    "Same as StaticDependencies, but yields Vertex objects"
+
+    def __init__(self, dependencies, **kwargs):
+        super().__init__(**kwargs)
+        self.dependencies = dependencies
+
+    def vertices(self, node):
+        for src, deps in self.dependencies:
+            if src == node:
+                for sub_node in deps:
+                    yield Vertex("static", node, sub_node)
 
 class SimpleGraphTest(unittest.TestCase):
     def test_single_node(self):
@@ -98,6 +121,24 @@ class SimpleGraphTest(unittest.TestCase):
                          set(dep_graph.dependencies("A", True)))
 
 
+    def test_static_vertices(self):
+        "Test that StaticDependencies yields (type, from, to) tuples"
+        graph = StaticDependencies([("A", ("B", "C"))])
+        self.assertEqual([("static", "A", "B"), ("static", "A", "C")],
+                         list(graph.vertices("A")))
+
+    def test_mixed_plugins(self):
+        "Test that Vertex and tuple plugins emitting the same edge are merged"
+        tuples = StaticDependencies([("A", ("B", "C"))])
+        vertices = VertexDependencies([("A", ("C", "D"))])
+
+        dep_graph = DependencyGraph(["A"], plugins=[tuples, vertices])
+        self.assertEqual(len(dep_graph.vertices), 3)
+        self.assertEqual(len(dep_graph.nodes), 4)
+        self.assertTrue(all(isinstance(v, Vertex) for v in dep_graph.vertices))
+        self.assertEqual({"B", "C", "D"},
+                         set(dep_graph.dependencies("A")))
+
     def test_lots_nodes(self):
         "Test with a lots of nodes"
         deps = []
@@ -118,5 +159,113 @@ class SimpleGraphTest(unittest.TestCase):
             ("D", ("A")),
         ])
 
-        with self.assertRaises(CircularDependencyError):
+        with self.assertRaisesRegex(CircularDependencyError, "^A --> D --> A$"):
             DependencyGraph(["A"], plugins=[graph,])
+
+    def test_acyclic(self):
+        "Test that a built graph reports itself as acyclic"
+        graph = StaticDependencies([
+            ("A", ("B", "C")),
+            ("B", ("C",)),
+        ])
+        self.assertTrue(DependencyGraph(["A"], plugins=[graph,]).is_acyclic())
+
+    def test_repeated_dependencies(self):
+        "Test that repeated queries give the same dependencies"
+        graph = StaticDependencies([
+            ("A", ("B", "C")),
+            ("B", ("D",)),
+            ("C", ("D",)),
+            ("D", ("E",)),
+        ])
+        dep_graph = DependencyGraph(["A"], plugins=[graph,])
+        self.assertEqual({"D", "E"}, set(dep_graph.dependencies("B", True)))
+        for _ in range(2):
+            self.assertEqual({"B", "C", "D", "E"},
+                             set(dep_graph.dependencies("A", True)))
+        self.assertEqual({"E"}, set(dep_graph.dependencies("D", True)))
+
+    def test_graph_released(self):
+        "Test that querying a graph doesn't keep it alive"
+        graph = StaticDependencies([("A", ("B",))])
+        dep_graph = DependencyGraph(["A"], plugins=[graph,])
+        list(dep_graph.dependencies("A", True))
+
+        ref = weakref.ref(dep_graph)
+        del dep_graph
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_deep_chain(self):
+        "Test a chain deeper than the recursion limit"
+        deps_nb = 5000
+        graph = StaticDependencies(
+            [(str(i), (str(i+1),)) for i in range(deps_nb - 1)])
+
+        dep_graph = DependencyGraph(["0"], plugins=[graph,])
+        self.assertEqual(len(dep_graph.nodes), deps_nb)
+        self.assertEqual(len(set(dep_graph.dependencies("0", True))), deps_nb - 1)
+
+
+class VertexTest(unittest.TestCase):
+    def test_attributes(self):
+        "Test that extra attributes are kept and don't affect identity"
+        plain = Vertex("static", "A", "B")
+        attributed = Vertex("static", "A", "B", weight=3)
+        self.assertEqual(attributed.weight, 3)
+        self.assertEqual(plain, attributed)
+        self.assertEqual(hash(plain), hash(attributed))
+        self.assertEqual(len({plain, attributed}), 1)
+
+    def test_copy_and_pickle(self):
+        "Test that vertices can be copied and pickled"
+        for vertex in (Vertex("static", "A", "B"),
+                       Vertex("static", "A", "B", weight=3),
+                       CustomVertex("static", "A", "B"),
+                       CustomVertex("static", "A", "B", weight=3)):
+            for clone in (copy.copy(vertex), copy.deepcopy(vertex),
+                          pickle.loads(pickle.dumps(vertex))):
+                self.assertIs(type(clone), type(vertex))
+                self.assertEqual(clone, vertex)
+                self.assertEqual(hash(clone), hash(vertex))
+                self.assertEqual(getattr(clone, "weight", None),
+                                 getattr(vertex, "weight", None))
+
+
+class Node:
+    def __init__(self, name):
+        self.name = name
+
+
+class PluginTest(unittest.TestCase):
+    def test_any_extension(self):
+        "Test that the default plugin accepts every node"
+        self.assertTrue(Plugin().can_create_vertex(Node("a.css")))
+
+    def test_single_extension(self):
+        "Test a plugin with one file extension"
+        plugin = Plugin(file_extensions=".html")
+        self.assertTrue(plugin.can_create_vertex(Node("index.html")))
+        self.assertFalse(plugin.can_create_vertex(Node("index.css")))
+
+    def test_multiple_extensions(self):
+        "Test a plugin with a tuple of file extensions"
+        class AssetPlugin(Plugin):
+            file_extensions = (".js", ".css")
+
+        plugin = AssetPlugin()
+        self.assertTrue(plugin.can_create_vertex(Node("app.js")))
+        self.assertTrue(plugin.can_create_vertex(Node("app.css")))
+        self.assertFalse(plugin.can_create_vertex(Node("index.html")))
+
+    def test_without_base_init(self):
+        "Test a plugin that doesn't call Plugin.__init__"
+        class CustomPlugin(Plugin):
+            file_extensions = (".js",)
+
+            def __init__(self):
+                pass
+
+        plugin = CustomPlugin()
+        self.assertTrue(plugin.can_create_vertex(Node("app.js")))
+        self.assertFalse(plugin.can_create_vertex(Node("app.css")))